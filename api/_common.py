@@ -0,0 +1,558 @@
+"""Shared infrastructure for both app variants (app.py and api/index.py).
+
+Both variants used to carry near-identical copies of the geocoding stack,
+caches and URL parsing; besides the duplicate module init (two Nominatim
+clients, two cache files) the copies could drift and never shared cache
+hits. Everything here is variant-agnostic and safe to import from either.
+"""
+
+from flask.json.provider import JSONProvider
+from geopy.geocoders import Nominatim, GoogleV3
+from geopy.adapters import RequestsAdapter
+from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+from geopy.extra.rate_limiter import RateLimiter
+from urllib3.util.retry import Retry
+import asyncio
+import re
+import random
+import time
+import logging
+import os
+import csv
+import json
+import sqlite3
+import threading
+import unicodedata
+from functools import lru_cache
+
+import aiohttp
+import orjson
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class ORJSONProvider(JSONProvider):
+    """orjson-backed JSON provider: every jsonify call (error payloads,
+    health checks) serializes 2-3x faster than with stdlib json, without
+    touching the call sites."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+def _geopy_adapter_factory(**kwargs):
+    """Pooled requests adapter so repeated geocoder calls reuse one TCP+TLS
+    connection instead of paying a fresh handshake per lookup, with
+    centralized backoff on 429/5xx responses."""
+    return RequestsAdapter(
+        pool_connections=16,
+        pool_maxsize=32,
+        max_retries=Retry(total=3, backoff_factor=0.5,
+                          status_forcelist=[429, 500, 502, 503, 504]),
+        **kwargs,
+    )
+
+# Initialize geocoder with custom user agent
+geolocator = Nominatim(user_agent="citation-map-app-v5",
+                       adapter_factory=_geopy_adapter_factory)
+
+# Optional Google tier: noticeably better precision on university names
+# and no 1 req/s cap (Google allows ~50 QPS, so parallel lookups are not
+# throttled). Used between the bundled gazetteer and Nominatim when a key
+# is configured; Nominatim remains the keyless fallback.
+_GOOGLE_MAPS_KEY = os.environ.get('GOOGLE_MAPS_KEY')
+google_geolocator = (
+    GoogleV3(api_key=_GOOGLE_MAPS_KEY, adapter_factory=_geopy_adapter_factory)
+    if _GOOGLE_MAPS_KEY else None
+)
+
+# Which backend leads: 'google' (when a key is present) or 'nominatim'.
+# Setting GEOCODER_PROVIDER=nominatim forces the free backend even with a
+# key configured, e.g. to conserve Google quota in staging.
+GEOCODER_PROVIDER = os.environ.get(
+    'GEOCODER_PROVIDER', 'google' if _GOOGLE_MAPS_KEY else 'nominatim')
+
+class DiskCache:
+    """Tiny sqlite-backed key/value cache stored under /tmp.
+
+    The in-process dicts used previously vanished on every serverless cold
+    start, forcing the same institutions and authors to be re-fetched each
+    invocation. Values are JSON-encoded and may carry an expiry timestamp.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            # WAL with synchronous=NORMAL drops the per-commit fsync
+            # (writes sync at checkpoint instead), so a cache store costs
+            # about as much as the dict insert it replaced rather than a
+            # disk flush; WAL also lets reads proceed during writes
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('PRAGMA temp_store=MEMORY')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache '
+                '(key TEXT PRIMARY KEY, value TEXT, expires REAL)'
+            )
+            # Expired rows are filtered on read but were never deleted,
+            # so the file grew without bound; one sweep per process start
+            # keeps it tidy without a cleanup thread
+            self._conn.execute(
+                'DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?',
+                (time.time(),)
+            )
+            self._conn.commit()
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires FROM cache WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return default
+        value, expires = row
+        if expires is not None and expires < time.time():
+            return default
+        return json.loads(value)
+
+    def set(self, key, value, expire=None):
+        expires = time.time() + expire if expire else None
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                (key, json.dumps(value), expires)
+            )
+            self._conn.commit()
+
+# Sentinel distinguishing "not cached" from a cached negative result
+_CACHE_MISS = object()
+
+class _AsyncTokenBucket:
+    """Cooperative pacing for async callers.
+
+    Blocking a thread with time.sleep for the whole delay starves
+    whichever pool the caller runs on. Callers instead reserve a
+    timestamp slot under a plain lock (safe across per-request event
+    loops) and wait on the loop with asyncio.sleep, keeping threads free
+    for actual I/O. Optional jitter spreads the slot spacing so traffic
+    stays non-uniform.
+    """
+
+    def __init__(self, rate, period, jitter=0.0):
+        self._interval = period / rate
+        self._jitter = jitter
+        self._next_free = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._next_free - now)
+            self._next_free = (max(now, self._next_free) + self._interval
+                               + (random.uniform(0, self._jitter) if self._jitter else 0.0))
+        return wait
+
+    async def acquire(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self):
+        """Blocking twin of acquire() for thread-pool callers. Both draw
+        from the same slot ledger, so sync and async consumers together
+        respect one aggregate rate."""
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+# Nominatim's usage policy is one request per second, enforced for BOTH
+# the sync (geopy) and async (aiohttp) clients by the single token
+# bucket below — two independent limiters would each allow 1 req/s and
+# exceed the policy in aggregate. geopy's RateLimiter is kept purely for
+# its retry-after-cool-off handling of transient geocoder errors; its
+# own delay is disabled in favor of the shared bucket.
+_nominatim_bucket = _AsyncTokenBucket(rate=1, period=1)
+_nominatim_geocode = RateLimiter(geolocator.geocode, min_delay_seconds=0,
+                                 max_retries=2, error_wait_seconds=5.0)
+
+# Precompiled pieces of the cache-key normalizer. Abbreviation marks are
+# deleted outright so "M.I.T." folds to "mit"; remaining punctuation
+# becomes a space so hyphenated names keep their word boundaries.
+_ABBREV_PUNCT_RE = re.compile(r"[.'’]")
+_PUNCT_RE = re.compile(r'[^\w\s]')
+_WS_RE = re.compile(r'\s+')
+_DEPT_PREFIX_RE = re.compile(r'^(?:dept|department|school|faculty)\s+of\s+')
+# Honorifics: "Professor of Physics at Stanford" keeps only what follows
+# "at"; any leading run of bare title words is dropped afterwards
+_HONORIFIC_AT_RE = re.compile(
+    r'^(?:prof|professor|dr|phd|postdoc|postdoctoral|student|researcher|lecturer)\b.*?\bat\s+')
+_TITLE_PREFIX_RE = re.compile(
+    r'^(?:(?:prof|professor|dr|phd|postdoc|postdoctoral|student|researcher|lecturer|fellow|assistant|associate|emeritus)\s+)+')
+
+def _geocode_key(institution):
+    """Normalized geocode cache key.
+
+    Scholar affiliation strings are messy free text: the same institution
+    appears with varying case, Unicode width, punctuation ("M.I.T."),
+    stray whitespace and department prefixes. Folding all of those onto
+    one key turns duplicate spellings into cache hits instead of extra
+    Nominatim round trips. The original string is still what gets sent
+    to the geocoder.
+    """
+    key = unicodedata.normalize('NFKC', institution).lower()
+    key = _ABBREV_PUNCT_RE.sub('', key)
+    key = _PUNCT_RE.sub(' ', key)
+    key = _WS_RE.sub(' ', key).strip()
+    key = _HONORIFIC_AT_RE.sub('', key)
+    key = _TITLE_PREFIX_RE.sub('', key)
+    return _DEPT_PREFIX_RE.sub('', key)
+
+# Affiliation strings that name no institution at all. Without this
+# filter "Unknown" reaches Nominatim and burns a full 1 req/s slot
+# (and a cache row) on a query that can never resolve.
+_PLACEHOLDERS = frozenset({
+    '', 'unknown', 'n/a', 'na', 'none', 'not available',
+    'independent researcher', 'independent scholar', 'retired',
+})
+
+def is_placeholder_affiliation(affiliation):
+    """True if the affiliation is empty or a known non-institution."""
+    return not affiliation or affiliation.strip().lower() in _PLACEHOLDERS
+
+# Geocoding results rarely change; keep them for 30 days
+_GEOCODE_TTL = 30 * 24 * 3600
+
+# Cache for geocoding results
+geocode_cache = DiskCache('/tmp/citation_map_geocode.db')
+
+# In-memory L1 in front of the sqlite layer: hot institutions skip the
+# disk read. Keyed on the same normalized key, TTL matching the disk
+# entries, locked because lookups run on pool threads. Values may be a
+# cached None (negative result), hence the sentinel-based get.
+_geocode_l1 = TTLCache(maxsize=10000, ttl=_GEOCODE_TTL)
+_geocode_l1_lock = threading.Lock()
+
+def _l1_get(cache_key):
+    with _geocode_l1_lock:
+        return _geocode_l1.get(cache_key, _CACHE_MISS)
+
+def _l1_set(cache_key, value):
+    with _geocode_l1_lock:
+        _geocode_l1[cache_key] = value
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+
+# Bundled gazetteer: well-known institutions (plus common aliases) resolve
+# to coordinates with an O(1) dict lookup instead of a Nominatim round trip
+_INSTITUTIONS_CSV = os.path.join(_DATA_DIR, 'institutions.csv')
+
+def _load_institution_coords():
+    coords = {}
+    try:
+        with open(_INSTITUTIONS_CSV, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                coords[_geocode_key(row['name'])] = {
+                    'lat': float(row['lat']),
+                    'lng': float(row['lng']),
+                    'address': row['name'],
+                }
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning("Could not load bundled institution gazetteer: %s", e)
+    return coords
+
+INST_COORDS = _load_institution_coords()
+
+# Alias table collapsing common variants ("M.I.T.", "UC Berkeley spelled
+# out", abbreviations) onto one canonical name, so each institution is
+# geocoded and counted once instead of per spelling
+_ALIASES_JSON = os.path.join(_DATA_DIR, 'institution_aliases.json')
+
+def _load_institution_aliases():
+    try:
+        with open(_ALIASES_JSON, encoding='utf-8') as f:
+            return {_geocode_key(k): v for k, v in json.load(f).items()}
+    except (OSError, ValueError) as e:
+        logger.warning("Could not load institution alias table: %s", e)
+        return {}
+
+INST_ALIASES = _load_institution_aliases()
+
+# The map popup shows at most five author names per location. Capping at
+# insertion keeps per-affiliation memory constant and preserves
+# first-seen order, where the old set-then-slice kept every name and
+# returned five in arbitrary order.
+_LOCATION_AUTHOR_CAP = 5
+
+def note_location_author(authors, name):
+    """Add a name to a capped, order-preserving author sample list."""
+    if len(authors) < _LOCATION_AUTHOR_CAP and name not in authors:
+        authors.append(name)
+
+def canonical_institution(institution):
+    """Collapse a raw institution string onto its canonical name."""
+    institution = institution.strip()
+    return INST_ALIASES.get(_geocode_key(institution), institution)
+
+def _gazetteer_match(cache_key):
+    """Resolve a normalized affiliation key against the bundled gazetteer.
+
+    Exact hits come first. Failing that, affiliation strings frequently
+    embed a known institution inside extra context ("Computer Science,
+    Stanford University, CA"), so scan for a gazetteer or alias name
+    appearing as a whole-token substring. The scan is a few hundred
+    string containment checks — microseconds against the Nominatim round
+    trip it replaces.
+    """
+    hit = INST_COORDS.get(cache_key)
+    if hit:
+        return hit
+    alias = INST_ALIASES.get(cache_key)
+    if alias:
+        return INST_COORDS.get(_geocode_key(alias))
+    padded = f' {cache_key} '
+    for name_key, coords in INST_COORDS.items():
+        if f' {name_key} ' in padded:
+            return coords
+    # Single-word aliases ("oxford", "columbia", "duke") collide with
+    # place names and surnames embedded in unrelated affiliations
+    # ("Miami University, Oxford, Ohio"), and a wrong gazetteer hit is
+    # final — the real geocoder never gets a chance to correct it. So
+    # only multi-word aliases join the embedded scan; bare aliases still
+    # resolve via the exact-key lookup above, where "oxford" on its own
+    # reasonably means the university.
+    for alias_key, canonical in INST_ALIASES.items():
+        if ' ' in alias_key and f' {alias_key} ' in padded:
+            return INST_COORDS.get(_geocode_key(canonical))
+    return None
+
+# In-flight lookups keyed by normalized key. Concurrent callers racing
+# on the same institution (e.g. two analyses of colleagues) wait on the
+# first caller's Event and read its cached result, so only one outbound
+# request per institution is ever in flight.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def geocode_institution(institution):
+    """Geocode an institution name to coordinates."""
+    if is_placeholder_affiliation(institution):
+        return None
+
+    institution = institution.strip()
+    cache_key = _geocode_key(institution)
+
+    # Bundled gazetteer first: zero-latency hit for well-known
+    # institutions, exact or embedded in a longer affiliation string
+    gazetteer_hit = _gazetteer_match(cache_key)
+    if gazetteer_hit:
+        return gazetteer_hit
+
+    # Check caches, memory before disk
+    cached = _l1_get(cache_key)
+    if cached is not _CACHE_MISS:
+        return cached
+    cached = geocode_cache.get(cache_key, _CACHE_MISS)
+    if cached is not _CACHE_MISS:
+        _l1_set(cache_key, cached)
+        return cached
+
+    # Single-flight: first caller owns the lookup, the rest wait and
+    # read whatever it cached (the failure path caches None, so waiters
+    # always find an entry)
+    with _inflight_lock:
+        pending = _inflight.get(cache_key)
+        if pending is None:
+            _inflight[cache_key] = threading.Event()
+    if pending is not None:
+        pending.wait(timeout=30)
+        return geocode_cache.get(cache_key)
+
+    try:
+        return _geocode_uncached(institution, cache_key)
+    finally:
+        with _inflight_lock:
+            event = _inflight.pop(cache_key, None)
+        if event is not None:
+            event.set()
+
+def _geocode_uncached(institution, cache_key):
+    """Issue the actual geocoder request and cache the outcome."""
+    try:
+        location = None
+        if GEOCODER_PROVIDER == 'google' and google_geolocator is not None:
+            try:
+                location = google_geolocator.geocode(institution, timeout=10)
+            except (GeocoderTimedOut, GeocoderServiceError) as e:
+                logger.warning("Google geocoding failed for %s: %s", institution, e)
+        if location is None:
+            # Reserve a slot from the shared bucket only when a Nominatim
+            # request is actually issued, never on cache hits
+            _nominatim_bucket.acquire_sync()
+            location = _nominatim_geocode(institution, timeout=10)
+        if location:
+            result = {
+                'lat': location.latitude,
+                'lng': location.longitude,
+                'address': location.address
+            }
+            _l1_set(cache_key, result)
+            geocode_cache.set(cache_key, result, expire=_GEOCODE_TTL)
+            return result
+    except (GeocoderTimedOut, GeocoderServiceError) as e:
+        logger.warning("Geocoding failed for %s: %s", institution, e)
+    except Exception as e:
+        logger.error("Unexpected error geocoding %s: %s", institution, e)
+
+    _l1_set(cache_key, None)
+    geocode_cache.set(cache_key, None, expire=_GEOCODE_TTL)
+    return None
+
+# Nominatim's public /search endpoint, for event-loop callers that want
+# to skip the sync geopy stack entirely
+_NOMINATIM_SEARCH_URL = 'https://nominatim.openstreetmap.org/search'
+
+async def geocode_institution_async(session, institution):
+    """Async variant of geocode_institution for event-loop callers.
+
+    Same gazetteer -> disk cache -> network ladder, but the Nominatim
+    request runs on an aiohttp session: DNS, TLS and parsing overlap
+    with the mandated 1 req/s spacing instead of each lookup holding a
+    pool thread for its full duration. The Google tier is sync-only, so
+    callers configured for it should stay on geocode_institution.
+    """
+    if is_placeholder_affiliation(institution):
+        return None
+
+    institution = institution.strip()
+    cache_key = _geocode_key(institution)
+
+    gazetteer_hit = _gazetteer_match(cache_key)
+    if gazetteer_hit:
+        return gazetteer_hit
+
+    cached = _l1_get(cache_key)
+    if cached is not _CACHE_MISS:
+        return cached
+    cached = geocode_cache.get(cache_key, _CACHE_MISS)
+    if cached is not _CACHE_MISS:
+        _l1_set(cache_key, cached)
+        return cached
+
+    try:
+        await _nominatim_bucket.acquire()
+        async with session.get(
+                _NOMINATIM_SEARCH_URL,
+                params={'q': institution, 'format': 'json', 'limit': 1},
+                headers={'User-Agent': 'citation-map-app-v5'}) as resp:
+            resp.raise_for_status()
+            matches = await resp.json()
+        if matches:
+            result = {
+                'lat': float(matches[0]['lat']),
+                'lng': float(matches[0]['lon']),
+                'address': matches[0].get('display_name', institution),
+            }
+            _l1_set(cache_key, result)
+            geocode_cache.set(cache_key, result, expire=_GEOCODE_TTL)
+            return result
+    except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+        logger.warning("Async geocoding failed for %s: %s", institution, e)
+    except Exception as e:
+        logger.error("Unexpected error geocoding %s: %s", institution, e)
+
+    _l1_set(cache_key, None)
+    geocode_cache.set(cache_key, None, expire=_GEOCODE_TTL)
+    return None
+
+# Cache for author affiliations; profiles move rarely, so a month is safe
+author_cache = DiskCache('/tmp/citation_map_authors.db')
+_AUTHOR_TTL = 30 * 24 * 3600
+
+# Filled publications keyed by author_pub_id: filling is one of the
+# heaviest Scholar operations (HTML fetch + parse), IDs are stable, and
+# citation counts move slowly enough that a day of staleness is fine
+pub_cache = DiskCache('/tmp/citation_map_pubs.db')
+_PUB_TTL = 24 * 3600
+
+# Precompiled patterns for the affiliation parsing hot path —
+# clean_affiliation runs once per citing author, so skip the per-call
+# re-cache lookups
+_SPLIT_RE = re.compile(r'[;,]|\band\b')
+_AT_RE = re.compile(r'.*?\bat\b|.*?@', re.IGNORECASE)
+_TITLE_RE = re.compile(
+    r'\b(director|manager|chair|engineer|professor|lecturer|phd|postdoc|student|researcher)\b',
+    re.IGNORECASE)
+
+@lru_cache(maxsize=4096)
+def clean_affiliation(affiliation_string):
+    """Clean affiliation string to extract institution name."""
+    if not affiliation_string:
+        return ''
+
+    # Fast path: strings with no delimiter, email or title marker (the
+    # majority of clean institution names) need no regex work at all
+    s = affiliation_string.strip()
+    padded = f' {s.lower()} '
+    if (';' not in s and ',' not in s and '@' not in s
+            and ' and ' not in padded and ' at ' not in padded
+            and not _TITLE_RE.search(s)):
+        return s
+
+    # Split by common delimiters
+    parts = _SPLIT_RE.split(affiliation_string)
+
+    # Take the first meaningful part
+    for part in parts:
+        part = part.strip()
+        # Remove titles and positions
+        cleaned = _AT_RE.sub('', part).strip()
+        # Skip if it's just a title
+        if _TITLE_RE.search(cleaned):
+            continue
+        if len(cleaned) > 3:
+            return cleaned
+
+    return affiliation_string.strip()
+
+def _force_lxml_parser():
+    """Pin scholarly's HTML parsing to lxml's C parser.
+
+    scholarly builds BeautifulSoup trees with the pure-Python parser,
+    which is the one real compute cost left on Scholar pages with many
+    citation rows; lxml parses the same markup several times faster.
+    scholarly binds BeautifulSoup by name inside its navigator module,
+    so that binding is what gets wrapped. Guarded throughout: a missing
+    lxml or a scholarly refactor falls back to the default parser.
+    """
+    try:
+        import lxml  # noqa: F401  probe availability before patching
+        from scholarly import _navigator
+    except Exception as e:
+        logger.debug("Could not pin lxml parser for scholarly: %s", e)
+        return
+
+    original_soup = _navigator.BeautifulSoup
+
+    def _lxml_soup(markup, *args, **kwargs):
+        # Drop whatever parser scholarly passed and substitute lxml
+        kwargs.pop('features', None)
+        return original_soup(markup, features='lxml', **kwargs)
+
+    _navigator.BeautifulSoup = _lxml_soup
+
+_force_lxml_parser()
+
+# One pass, named groups: either a profile URL's user= parameter or a
+# bare 12-character Scholar author ID pasted directly
+_AUTHOR_ID_RE = re.compile(
+    r'user=(?P<gid>[a-zA-Z0-9_-]+)|^(?P<bare>[a-zA-Z0-9_-]{12})$')
+
+@lru_cache(maxsize=128)
+def extract_author_id(url):
+    """Extract a Google Scholar author ID from a profile URL or bare ID."""
+    match = _AUTHOR_ID_RE.search(url.strip())
+    if match:
+        return match.group('gid') or match.group('bare')
+    return None
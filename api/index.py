@@ -1,146 +1,199 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
 from scholarly import scholarly, ProxyGenerator
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+from urllib3.util.retry import Retry
+from requests.adapters import HTTPAdapter
 import requests
-import re
+import httpx
+import aiohttp
+import orjson
 import time
-import random
 import logging
 import os
+import hashlib
+import heapq
+import uuid
+import queue
+import threading
+import asyncio
+from itertools import islice
+from cachetools import TTLCache, cached
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Geocoding, caching and URL-parsing infrastructure shared with app.py.
+# Vercel imports this file with api/ itself on sys.path, hence the fallback.
+try:
+    from api._common import (
+        ORJSONProvider, DiskCache, _CACHE_MISS, _AsyncTokenBucket, _geocode_key,
+        geocode_cache, _gazetteer_match, canonical_institution,
+        geocode_institution, geocode_institution_async,
+        GEOCODER_PROVIDER, google_geolocator, extract_author_id,
+        author_cache, _AUTHOR_TTL, clean_affiliation,
+        is_placeholder_affiliation, note_location_author,
+        pub_cache, _PUB_TTL,
+    )
+    from api.scholar_client import DIRECT_SCHOLAR, analyze_direct
+except ImportError:
+    from _common import (
+        ORJSONProvider, DiskCache, _CACHE_MISS, _AsyncTokenBucket, _geocode_key,
+        geocode_cache, _gazetteer_match, canonical_institution,
+        geocode_institution, geocode_institution_async,
+        GEOCODER_PROVIDER, google_geolocator, extract_author_id,
+        author_cache, _AUTHOR_TTL, clean_affiliation,
+        is_placeholder_affiliation, note_location_author,
+        pub_cache, _PUB_TTL,
+    )
+    from scholar_client import DIRECT_SCHOLAR, analyze_direct
 
 # Get the correct template folder path
 template_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
 app = Flask(__name__, template_folder=template_dir)
 CORS(app)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+app.json = ORJSONProvider(app)
+
+# Configure logging; default to WARNING in production since synchronous
+# stderr writes are surprisingly expensive on serverless log ingest
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING'))
 logger = logging.getLogger(__name__)
 
-# Initialize geocoder with custom user agent
-geolocator = Nominatim(user_agent="citation-map-app-v5")
+# Completed analyses are nearly idempotent for a given (author, params)
+# tuple over short windows; cache the full response for an hour so repeat
+# URLs skip the whole pipeline
+result_cache = DiskCache('/tmp/citation_map_results.db')
+_RESULT_TTL = 3600
+
+# Shared pool for blocking scholarly calls; concurrency is bounded per
+# request by an asyncio.Semaphore to stay under Scholar rate limits
+_SCHOLAR_POOL = ThreadPoolExecutor(max_workers=5)
+_SCHOLAR_CONCURRENCY = 5
 
-# Cache for geocoding results
-geocode_cache = {}
+# ~1 call per 2s on average (plus jitter), matching the old 1-3s sleeps
+_scholar_limiter = _AsyncTokenBucket(rate=5, period=10, jitter=1.0)
 
-# Cache for author affiliations
-author_cache = {}
+# Guards scholarly.use_proxy against racing with in-flight requests
+_proxy_lock = threading.Lock()
+
+# Tracks the previous setup outcome so routine refresh ticks log at
+# DEBUG and only state changes surface at INFO
+_proxy_was_enabled = False
 
 # Setup proxy for scholarly
 def setup_proxy():
-    """Setup proxy for scholarly to bypass Google Scholar blocking."""
+    """Setup proxy for scholarly to bypass Google Scholar blocking.
+
+    With SCRAPER_API_KEY set, uses ScraperAPI's rotating paid proxies —
+    instant setup and far more reliable than FreeProxies(), which scans
+    the open internet for working proxies (often 10-60s, frequently
+    yielding dead ones).
+    """
+    global _proxy_was_enabled
     try:
         pg = ProxyGenerator()
-        success = pg.FreeProxies()
+        scraper_api_key = os.environ.get('SCRAPER_API_KEY')
+        if scraper_api_key:
+            success = pg.ScraperAPI(scraper_api_key)
+        else:
+            success = pg.FreeProxies()
         if success:
-            scholarly.use_proxy(pg)
-            logger.info("Proxy setup successful")
+            with _proxy_lock:
+                scholarly.use_proxy(pg)
+            logger.log(logging.DEBUG if _proxy_was_enabled else logging.INFO,
+                       "Proxy setup successful")
+            _proxy_was_enabled = True
             return True
     except Exception as e:
-        logger.warning(f"Could not setup proxy: {e}")
+        logger.warning("Could not setup proxy: %s", e)
+    _proxy_was_enabled = False
     return False
 
 # Try to setup proxy on startup
 proxy_enabled = setup_proxy()
 
-def clean_affiliation(affiliation_string):
-    """Clean affiliation string to extract institution name."""
-    if not affiliation_string:
-        return ''
-
-    # Split by common delimiters
-    parts = re.split(r'[;,]|\band\b', affiliation_string)
-
-    # Take the first meaningful part
-    for part in parts:
-        part = part.strip()
-        # Remove titles and positions
-        cleaned = re.sub(r'.*?\bat\b|.*?@', '', part, flags=re.IGNORECASE).strip()
-        # Skip if it's just a title
-        if re.search(r'\b(director|manager|chair|engineer|professor|lecturer|phd|postdoc|student|researcher)\b',
-                     cleaned, re.IGNORECASE):
+# Proxy validity drifts slowly, so refresh it on a timer in the background
+# rather than on the request path — FreeProxies() probes the network and
+# can take tens of seconds. A refresh tick is skipped while real Scholar
+# traffic is succeeding through the current pool: re-probing a working
+# pool wastes bandwidth and risks swapping good proxies for worse ones.
+_PROXY_REFRESH_INTERVAL = 300
+_last_scholar_success_ts = 0.0
+
+def _note_scholar_success():
+    global _last_scholar_success_ts
+    _last_scholar_success_ts = time.time()
+
+def _refresh_proxy_loop():
+    global proxy_enabled
+    while True:
+        time.sleep(_PROXY_REFRESH_INTERVAL)
+        if (proxy_enabled
+                and time.time() - _last_scholar_success_ts < _PROXY_REFRESH_INTERVAL):
             continue
-        if len(cleaned) > 3:
-            return cleaned
-
-    return affiliation_string.strip()
-
-def geocode_institution(institution):
-    """Geocode an institution name to coordinates."""
-    if not institution or institution.strip() == '':
-        return None
-
-    institution = institution.strip()
-
-    # Check cache first
-    if institution in geocode_cache:
-        return geocode_cache[institution]
-
-    try:
-        time.sleep(0.5)  # Rate limiting for Nominatim
-        location = geolocator.geocode(institution, timeout=10)
-        if location:
-            result = {
-                'lat': location.latitude,
-                'lng': location.longitude,
-                'address': location.address
-            }
-            geocode_cache[institution] = result
-            return result
-    except (GeocoderTimedOut, GeocoderServiceError) as e:
-        logger.warning(f"Geocoding failed for {institution}: {e}")
-    except Exception as e:
-        logger.error(f"Unexpected error geocoding {institution}: {e}")
+        proxy_enabled = setup_proxy() or proxy_enabled
 
-    geocode_cache[institution] = None
-    return None
+threading.Thread(target=_refresh_proxy_loop, daemon=True).start()
 
 def get_author_info(author_id):
-    """Get author information from Google Scholar with random delay."""
+    """Get author information from Google Scholar."""
     try:
-        time.sleep(random.uniform(1, 3))  # Random delay to avoid blocking
         author = scholarly.search_author_id(author_id)
         author = scholarly.fill(author, sections=['basics', 'publications'])
+        _note_scholar_success()
         return author
     except Exception as e:
-        logger.error(f"Error fetching author info: {e}")
+        logger.error("Error fetching author info: %s", e)
         return None
 
 def get_publication_details(pub):
-    """Fill publication details with random delay."""
+    """Fill publication details, cached on disk by author_pub_id."""
+    pub_id = pub.get('author_pub_id')
+    if pub_id:
+        cached = pub_cache.get(pub_id, _CACHE_MISS)
+        if cached is not _CACHE_MISS:
+            return cached
     try:
-        time.sleep(random.uniform(1, 3))
-        return scholarly.fill(pub)
+        filled = scholarly.fill(pub)
     except Exception as e:
-        logger.warning(f"Error filling publication: {e}")
+        logger.warning("Error filling publication: %s", e)
         return pub
+    if pub_id:
+        try:
+            pub_cache.set(pub_id, filled, expire=_PUB_TTL)
+        except (TypeError, ValueError):
+            pass  # non-JSON payloads simply skip the cache
+    return filled
 
 def get_citing_papers(publication, max_citations=10):
     """Get papers that cite this publication."""
     citing_papers = []
     try:
         citations = scholarly.citedby(publication)
-        count = 0
-        for citation in citations:
-            if count >= max_citations:
-                break
+        # islice stops pulling from the generator exactly at the cap,
+        # where the manual counter only broke after the next result had
+        # already been fetched. Authorless citations are dropped at the
+        # source — they can never contribute a citing author downstream.
+        for citation in islice(citations, max_citations):
+            if not citation.get('bib', {}).get('author'):
+                continue
             citing_papers.append(citation)
-            count += 1
-            time.sleep(random.uniform(0.5, 1.5))  # Small delay between citations
+        _note_scholar_success()
     except Exception as e:
-        logger.warning(f"Error getting citations: {e}")
+        logger.warning("Error getting citations: %s", e)
     return citing_papers
 
+# The TTL layer keeps hot names in memory so repeat lookups within a
+# process skip even the sqlite round trip; the disk layer below survives
+# restarts. Lock because lookups run on the scholar thread pool.
+@cached(TTLCache(maxsize=10000, ttl=3600), lock=threading.Lock())
 def get_author_affiliation(author_name):
     """Get affiliation for a citing author."""
     # Check cache first
-    if author_name in author_cache:
-        return author_cache[author_name]
+    cached = author_cache.get(author_name, _CACHE_MISS)
+    if cached is not _CACHE_MISS:
+        return cached
 
     try:
-        time.sleep(random.uniform(1, 3))
         search_query = scholarly.search_author(author_name)
         author_result = next(search_query, None)
 
@@ -148,25 +201,204 @@ def get_author_affiliation(author_name):
             affiliation = author_result.get('affiliation', '')
             # Clean the affiliation
             cleaned = clean_affiliation(affiliation)
-            author_cache[author_name] = cleaned
+            author_cache.set(author_name, cleaned, expire=_AUTHOR_TTL)
             return cleaned
     except Exception as e:
-        logger.warning(f"Error getting affiliation for {author_name}: {e}")
+        logger.warning("Error getting affiliation for %s: %s", author_name, e)
 
-    author_cache[author_name] = ''
+    author_cache.set(author_name, '', expire=_AUTHOR_TTL)
     return ''
 
-def extract_author_id(url):
-    """Extract Google Scholar author ID from URL."""
-    patterns = [
-        r'user=([a-zA-Z0-9_-]+)',
-        r'citations\?.*user=([a-zA-Z0-9_-]+)',
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
+async def _process_publications(publications, max_citations_per_paper, on_pub=None):
+    """Process publications concurrently, returning (pub_info, citing_infos) pairs.
+
+    Each publication is filled and its citing papers fetched in parallel,
+    and the per-citing-author affiliation lookups are gathered as well.
+    The scholarly library is synchronous, so calls run on a thread pool
+    bounded by a semaphore to avoid hammering Google Scholar. The optional
+    on_pub callback fires as each publication completes, for streaming
+    consumers.
+    """
+    loop = asyncio.get_running_loop()
+    sem = asyncio.BoundedSemaphore(_SCHOLAR_CONCURRENCY)
+
+    async def run_blocking(func, *args):
+        async with sem:
+            # Pace on the event loop, not on a pool thread: the courtesy
+            # delay costs no thread while waiting
+            await _scholar_limiter.acquire()
+            return await loop.run_in_executor(_SCHOLAR_POOL, func, *args)
+
+    # Popular authors cite several of the same papers; share one lookup
+    # task per name across all publications so duplicates never trigger
+    # a second Scholar search (nor a second 1-3s courtesy delay), even
+    # when two publications hit the same name concurrently
+    affil_tasks = {}
+
+    def affiliation_task(name):
+        task = affil_tasks.get(name)
+        if task is None:
+            task = asyncio.ensure_future(run_blocking(get_author_affiliation, name))
+            affil_tasks[name] = task
+        return task
+
+    async def process_pub(pub):
+        # The author fill already reports per-publication citation counts,
+        # so only pay for a full publication fill (one Scholar round trip)
+        # when there are citations to follow up on
+        if pub.get('num_citations', 0) > 0:
+            pub_filled = await run_blocking(get_publication_details, pub)
+        else:
+            pub_filled = pub
+
+        pub_info = {
+            'title': pub_filled.get('bib', {}).get('title', 'Unknown'),
+            'year': pub_filled.get('bib', {}).get('pub_year', 'Unknown'),
+            'citations': pub_filled.get('num_citations', 0)
+        }
+
+        citing_infos = []
+        if pub_info['citations'] > 0:
+            citing_papers = await run_blocking(get_citing_papers, pub_filled, max_citations_per_paper)
+
+            pending = []
+            for citing_paper in citing_papers:
+                bib = citing_paper.get('bib', {})
+                authors = bib.get('author', '')
+
+                if authors:
+                    # scholarly parses citedby snippets into a list of
+                    # names; only a raw ' and '-joined byline (filled
+                    # publications) still needs the first name cut out
+                    if isinstance(authors, str):
+                        idx = authors.find(' and ')
+                        author_name = authors[:idx] if idx != -1 else authors
+                    else:
+                        author_name = authors[0]
+                    author_name = author_name.strip()
+                    if author_name and len(author_name) > 1:
+                        pending.append((author_name, bib))
+
+            # Look up all citing-author affiliations concurrently,
+            # deduplicated across publications via the shared task map
+            affiliations = await asyncio.gather(
+                *[affiliation_task(name) for name, _ in pending]
+            )
+
+            for (author_name, bib), affiliation in zip(pending, affiliations):
+                citing_infos.append({
+                    'name': author_name,
+                    'affiliation': affiliation,
+                    'paper_title': bib.get('title', 'Unknown'),
+                    'year': bib.get('pub_year', 'Unknown')
+                })
+
+        if on_pub:
+            on_pub(pub_info, citing_infos)
+        return pub_info, citing_infos
+
+    return await asyncio.gather(*[process_pub(pub) for pub in publications])
+
+async def _geocode_affiliations(affiliations, on_result=None):
+    """Geocode a set of unique affiliations, returning {affiliation: coords}.
+
+    Cached entries are served immediately with no delay. Uncached ones
+    reserve 1 Hz slots from the shared limiter — the first passes through
+    with no wait — and run on the thread pool, so the mandated pacing
+    overlaps with network latency instead of stacking on top of it.
+
+    When on_result is given it is called with (affiliation, coords) as
+    each lookup resolves — cached ones first, then the slow ones one by
+    one — so streaming consumers can forward locations incrementally.
+    """
+    loop = asyncio.get_running_loop()
+    results = {}
+
+    uncached = []
+    for affiliation in affiliations:
+        cache_key = _geocode_key(affiliation)
+        coords = _gazetteer_match(cache_key)
+        if coords is None:
+            coords = geocode_cache.get(cache_key, _CACHE_MISS)
+        if coords is not _CACHE_MISS:
+            results[affiliation] = coords
+            if on_result:
+                on_result(affiliation, coords)
+        else:
+            uncached.append(affiliation)
+
+    if GEOCODER_PROVIDER == 'google' and google_geolocator is not None:
+        # The Google tier only exists in the sync geopy stack; run those
+        # lookups on the thread pool as before
+        async def geo_one(affiliation):
+            coords = await loop.run_in_executor(_SCHOLAR_POOL, geocode_institution, affiliation)
+            if on_result:
+                on_result(affiliation, coords)
+            return affiliation, coords
+
+        resolved = await asyncio.gather(*[geo_one(a) for a in uncached])
+    else:
+        # Nominatim-only: hit /search directly over one aiohttp session,
+        # so the 1 req/s pacing is awaited on the event loop and DNS/TLS/
+        # parse work overlaps the spacing instead of holding pool threads
+        async with aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=10)) as session:
+            async def geo_one(affiliation):
+                coords = await geocode_institution_async(session, affiliation)
+                if on_result:
+                    on_result(affiliation, coords)
+                return affiliation, coords
+
+            resolved = await asyncio.gather(*[geo_one(a) for a in uncached])
+
+    for affiliation, coords in resolved:
+        results[affiliation] = coords
+
+    return results
+
+# Deferred geocoding jobs, an in-process stand-in for an external job
+# queue: this deployment has no Redis/RQ to lean on, so jobs run on
+# daemon threads and their state lives in a sqlite DiskCache. The disk
+# cache rather than a dict because gunicorn runs two workers — a poll
+# can land on a different worker than the one running the job, and the
+# WAL-mode database is safe to share across processes.
+_geocode_jobs = DiskCache('/tmp/citation_map_geocode_jobs.db')
+
+def _start_geocode_job(affil_counts, affil_authors):
+    """Kick off background geocoding; returns a job id for polling."""
+    job_id = uuid.uuid4().hex
+    locations = []
+
+    def save(done):
+        _geocode_jobs.set(job_id, {'done': done, 'locations': locations},
+                          expire=_RESULT_TTL)
+
+    save(done=False)
+
+    def on_result(affiliation, coords):
+        if not coords:
+            return
+        locations.append({
+            'institution': affiliation,
+            'lat': coords['lat'],
+            'lng': coords['lng'],
+            'count': affil_counts[affiliation],
+            'authors': affil_authors[affiliation]
+        })
+        # Rewrite the full row per result: geocoding is paced at ~1 req/s,
+        # so the write rate is trivial and polls always see fresh progress
+        save(done=False)
+
+    def run():
+        try:
+            asyncio.run(_geocode_affiliations(list(affil_counts), on_result=on_result))
+        except Exception as e:
+            logger.error("Geocode job %s failed: %s", job_id, e)
+        finally:
+            save(done=True)
+
+    threading.Thread(target=run, daemon=True).start()
+    return job_id
 
 @app.route('/')
 def index():
@@ -178,13 +410,13 @@ def health():
     """Health check endpoint."""
     return jsonify({
         'status': 'ok',
-        'proxy_enabled': proxy_enabled
+        'proxy_enabled': proxy_enabled,
+        'proxy_mode': 'scraperapi' if os.environ.get('SCRAPER_API_KEY') else 'free'
     })
 
-@app.route('/api/demo', methods=['POST'])
-def demo_analyze():
-    """Demo endpoint with sample data."""
-    result = {
+# The demo payload is constant; serialize it once at import so each
+# request is a straight memcpy instead of dict build + JSON encode
+_DEMO_BYTES = orjson.dumps({
         'author': {
             'name': 'Demo Author',
             'affiliation': 'Stanford University',
@@ -212,13 +444,25 @@ def demo_analyze():
             {'institution': 'Stanford University', 'lat': 37.4275, 'lng': -122.1697, 'count': 6, 'authors': ['Robert Lee']},
             {'institution': 'University of Cambridge', 'lat': 52.2053, 'lng': 0.1218, 'count': 2, 'authors': ['James Wilson']},
         ]
-    }
-    return jsonify(result)
+    })
+
+@app.route('/api/demo', methods=['POST'])
+def demo_analyze():
+    """Demo endpoint with sample data."""
+    return Response(_DEMO_BYTES, mimetype='application/json',
+                    headers={'Cache-Control': 'public, max-age=3600'})
 
 @app.route('/api/analyze', methods=['POST'])
-def analyze_scholar():
-    """Analyze a Google Scholar profile and return citation data."""
-    data = request.json
+async def analyze_scholar():
+    """Analyze a Google Scholar profile and return citation data.
+
+    A native async view: the whole pipeline runs on one event loop
+    instead of spinning up a fresh loop per stage with asyncio.run,
+    and blocking scholarly calls are pushed to the thread pool.
+    """
+    data = _request_json()
+    if data is None:
+        return jsonify({'error': 'Request body must be a JSON object.'}), 400
     scholar_url = data.get('url', '')
     max_papers = min(data.get('max_papers', 3), 5)  # Limit to reduce blocking risk
     max_citations_per_paper = min(data.get('max_citations', 5), 10)
@@ -230,13 +474,34 @@ def analyze_scholar():
             'error': 'Invalid Google Scholar URL. Please use a URL like: https://scholar.google.com/citations?user=XXXXX'
         }), 400
 
-    logger.info(f"Starting analysis for author ID: {author_id}")
-
-    # Reset proxy before starting
-    setup_proxy()
+    # Same validator scheme as the OpenAlex route: the ETag digests the
+    # request parameters, so browser revalidations within the cache
+    # window take the 304 path without touching Scholar or the geocoder.
+    # 304 only while result_cache still holds the entry — the digest
+    # never changes for a given query, so answering 304 past the server
+    # TTL would renew the client's stale copy forever.
+    cache_key = f"v1:{author_id}:{max_papers}:{max_citations_per_paper}"
+    etag = hashlib.blake2b(cache_key.encode(), digest_size=16).hexdigest()
+    cached_result = result_cache.get(cache_key)
+    if cached_result is not None:
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=304, headers={'ETag': etag})
+        logger.debug("Serving cached analysis for author ID: %s", author_id)
+        return _cacheable_response(cached_result, etag)
+
+    logger.debug("Starting analysis for author ID: %s", author_id)
+
+    if DIRECT_SCHOLAR:
+        author, pub_results = await analyze_direct(
+            author_id, max_papers, max_citations_per_paper)
+    else:
+        # Get author information (the proxy pool is refreshed in the
+        # background, so requests start immediately)
+        loop = asyncio.get_running_loop()
+        await _scholar_limiter.acquire()
+        author = await loop.run_in_executor(_SCHOLAR_POOL, get_author_info, author_id)
+        pub_results = None
 
-    # Get author information
-    author = get_author_info(author_id)
     if not author:
         return jsonify({
             'error': 'Could not fetch author information. Google Scholar may be blocking requests. Please try again later or use Demo mode.'
@@ -254,83 +519,470 @@ def analyze_scholar():
         'locations': []
     }
 
-    # Process publications (sorted by citations)
-    publications = author.get('publications', [])
-    publications = sorted(publications, key=lambda x: x.get('num_citations', 0), reverse=True)[:max_papers]
-
     all_citing_authors = []
-    affiliations_map = {}
+    affil_counts = Counter()
+    affil_authors = defaultdict(list)
 
-    for i, pub in enumerate(publications):
-        logger.info(f"Processing publication {i + 1}/{len(publications)}")
+    if pub_results is None:
+        # Process the most-cited publications; nlargest keeps a k-sized heap
+        # instead of fully sorting hundreds of entries to discard all but k
+        publications = heapq.nlargest(max_papers, author.get('publications', []),
+                                      key=lambda x: x.get('num_citations', 0) or 0)
 
-        # Get full publication details
-        pub_filled = get_publication_details(pub)
+        # Fetch publication details, citing papers and affiliations concurrently
+        pub_results = await _process_publications(publications, max_citations_per_paper)
 
-        pub_info = {
-            'title': pub_filled.get('bib', {}).get('title', 'Unknown'),
-            'year': pub_filled.get('bib', {}).get('pub_year', 'Unknown'),
-            'citations': pub_filled.get('num_citations', 0)
-        }
+    for pub_info, citing_infos in pub_results:
         result['publications'].append(pub_info)
 
-        # Get citing papers
-        if pub_info['citations'] > 0:
-            citing_papers = get_citing_papers(pub_filled, max_citations_per_paper)
+        for citing_info in citing_infos:
+            all_citing_authors.append(citing_info)
 
-            for citing_paper in citing_papers:
-                bib = citing_paper.get('bib', {})
-                author_str = bib.get('author', '')
-
-                if author_str:
-                    # Parse first author
-                    authors = author_str.split(' and ')
-                    if authors:
-                        author_name = authors[0].strip()
-
-                        if author_name and len(author_name) > 1:
-                            # Get affiliation for this author
-                            affiliation = get_author_affiliation(author_name)
-
-                            citing_info = {
-                                'name': author_name,
-                                'affiliation': affiliation,
-                                'paper_title': bib.get('title', 'Unknown'),
-                                'year': bib.get('pub_year', 'Unknown')
-                            }
-                            all_citing_authors.append(citing_info)
-
-                            # Track affiliations for map
-                            if affiliation:
-                                if affiliation not in affiliations_map:
-                                    affiliations_map[affiliation] = {
-                                        'count': 0,
-                                        'authors': []
-                                    }
-                                affiliations_map[affiliation]['count'] += 1
-                                if author_name not in affiliations_map[affiliation]['authors']:
-                                    affiliations_map[affiliation]['authors'].append(author_name)
+            # Track affiliations for map; Counter and set give O(1) updates
+            # where the old list-membership check was O(authors)
+            affiliation = citing_info['affiliation']
+            if not is_placeholder_affiliation(affiliation):
+                affil_counts[affiliation] += 1
+                note_location_author(affil_authors[affiliation], citing_info['name'])
 
     result['citing_authors'] = all_citing_authors
 
-    # Geocode affiliations
+    # Deferred mode: Nominatim's 1 req/s floor can keep the request open
+    # for as many seconds as there are unknown institutions, so clients
+    # may opt to take the Scholar results immediately and poll
+    # /api/locations/<job_id> while geocoding runs in the background
+    if data.get('defer_geocoding'):
+        result['geocode_job_id'] = _start_geocode_job(
+            affil_counts, affil_authors)
+        return _json_response(result)
+
+    # Geocode affiliations (already deduplicated by the counter keys);
+    # cached entries resolve instantly, the rest are pipelined at ~1 req/s
+    geocoded = await _geocode_affiliations(list(affil_counts))
+
     locations = []
-    for affiliation, info in affiliations_map.items():
-        coords = geocode_institution(affiliation)
+    for affiliation, count in affil_counts.items():
+        coords = geocoded.get(affiliation)
         if coords:
             locations.append({
                 'institution': affiliation,
                 'lat': coords['lat'],
                 'lng': coords['lng'],
-                'count': info['count'],
-                'authors': info['authors'][:5]
+                'count': count,
+                'authors': affil_authors[affiliation]
             })
 
     result['locations'] = locations
 
-    logger.info(f"Analysis complete. Found {len(all_citing_authors)} citing authors, {len(locations)} locations")
+    logger.info("Analysis complete. Found %s citing authors, %s locations", len(all_citing_authors), len(locations))
+
+    result_cache.set(cache_key, result, expire=_RESULT_TTL)
+
+    return _cacheable_response(result, etag)
+
+@app.route('/api/locations/<job_id>', methods=['GET'])
+def geocode_job_locations(job_id):
+    """Poll a deferred geocoding job for the locations found so far."""
+    job = _geocode_jobs.get(job_id, _CACHE_MISS)
+    if job is _CACHE_MISS:
+        return jsonify({'error': 'Unknown or expired geocoding job.'}), 404
+    return jsonify({'done': job['done'], 'locations': job['locations']})
+
+# --- OpenAlex path -------------------------------------------------------
+# OpenAlex exposes citation data through a real API (no scraping, no
+# proxies, 10 req/s with a mailto), which makes it far more reliable than
+# Scholar when the user can search by author name instead of profile URL.
+
+OPENALEX_API = 'https://api.openalex.org'
+OPENALEX_MAILTO = os.environ.get('OPENALEX_MAILTO', 'citation-map-app@example.com')
+
+# One pooled session for every synchronous OpenAlex call: reuses the TCP+TLS
+# connection across requests (the handshake otherwise dominates each call)
+# and centralizes retry/backoff on 429/5xx
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=32, pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3,
+                      status_forcelist=[429, 500, 502, 503, 504])))
+SESSION.headers.update({
+    'User-Agent': 'citation-map-app (mailto:%s)' % OPENALEX_MAILTO,
+    'Accept-Encoding': 'gzip',
+})
+
+# In-process TTL caches: the same author is typically analyzed several
+# times in a row (tweaked max_papers, page reloads), and these helpers
+# are pure w.r.t. their arguments over an hour. Callers must not mutate
+# the returned objects.
+@cached(TTLCache(maxsize=1024, ttl=3600), lock=threading.Lock())
+def search_author_openalex(query):
+    """Find the best-matching OpenAlex author record for a name."""
+    response = SESSION.get(
+        f'{OPENALEX_API}/authors',
+        params={'search': query, 'per-page': 1,
+                'select': 'id,display_name,cited_by_count,summary_stats,last_known_institution',
+                'mailto': OPENALEX_MAILTO},
+        timeout=30)
+    response.raise_for_status()
+    results = orjson.loads(response.content).get('results', [])
+    return results[0] if results else None
+
+def iter_author_works(author_id):
+    """Yield an author's works, most-cited first, across cursor pages.
+
+    Single calls capped by per-page silently truncate once the caller
+    wants more than one page; cursor pagination keeps fetching lazily,
+    so consumers take exactly what they need via islice and stop.
+    """
+    cursor = '*'
+    while cursor:
+        response = SESSION.get(
+            f'{OPENALEX_API}/works',
+            params={'filter': f'author.id:{author_id}',
+                    'sort': 'cited_by_count:desc',
+                    'per-page': 200,
+                    'cursor': cursor,
+                    'select': 'id,title,publication_year,cited_by_count',
+                    'mailto': OPENALEX_MAILTO},
+            timeout=30)
+        response.raise_for_status()
+        payload = orjson.loads(response.content)
+        yield from payload.get('results', [])
+        cursor = payload.get('meta', {}).get('next_cursor')
+
+@cached(TTLCache(maxsize=1024, ttl=3600), lock=threading.Lock())
+def get_author_works(author_id, limit):
+    """Fetch an author's most-cited works."""
+    return list(islice(iter_author_works(author_id), limit))
+
+async def _gather_citing_works(works, max_citations_per_paper):
+    """Fetch the citing works for every work concurrently.
+
+    All requests multiplex over one HTTP/2 connection — a single TLS
+    handshake for the whole batch with no head-of-line blocking between
+    streams — and a semaphore of 10 keeps aggregate concurrency under
+    OpenAlex's 10 req/s guidance.
+    """
+    sem = asyncio.Semaphore(10)
+    limits = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+    async with httpx.AsyncClient(http2=True, limits=limits, timeout=30) as client:
+
+        async def fetch_one(work):
+            work_id = work['id'].rsplit('/', 1)[-1]
+            try:
+                async with sem:
+                    response = await client.get(
+                        f'{OPENALEX_API}/works',
+                        params={'filter': f'cites:{work_id}',
+                                'per-page': max_citations_per_paper,
+                                'select': 'id,title,publication_year,authorships',
+                                'mailto': OPENALEX_MAILTO})
+                    response.raise_for_status()
+                    payload = orjson.loads(response.content)
+            except Exception as e:
+                logger.warning("Error fetching citing works for %s: %s", work_id, e)
+                return []
+            return payload.get('results', [])
+
+        return await asyncio.gather(*[fetch_one(work) for work in works])
+
+def get_citing_works_batch(works, max_citations_per_paper):
+    """Fetch citing works for all works in one OR-filtered request.
+
+    OpenAlex accepts pipe-joined OR filters, so cites:W1|W2|... collapses
+    N round trips into one; each returned work's referenced_works is
+    intersected with the original ids to attribute it back to the cited
+    work. Returns {work_id: [citing works]} in input order.
+    """
+    work_ids = [w['id'].rsplit('/', 1)[-1] for w in works if w.get('id')]
+    by_work = {wid: [] for wid in work_ids}
+    if not work_ids:
+        return by_work
+
+    pipe_ids = '|'.join(work_ids)
+    response = SESSION.get(
+        f'{OPENALEX_API}/works',
+        params={'filter': f'cites:{pipe_ids}',
+                'per-page': min(max_citations_per_paper * len(work_ids), 200),
+                'select': 'id,title,publication_year,authorships,referenced_works',
+                'mailto': OPENALEX_MAILTO},
+        timeout=30)
+    response.raise_for_status()
+
+    id_set = set(work_ids)
+    for citing_work in orjson.loads(response.content).get('results', []):
+        for ref in citing_work.get('referenced_works') or []:
+            ref_id = ref.rsplit('/', 1)[-1]
+            if ref_id in id_set and len(by_work[ref_id]) < max_citations_per_paper:
+                by_work[ref_id].append(citing_work)
+    return by_work
+
+# Pipe-joined filters beyond this length risk overrunning URL limits;
+# fall back to per-work concurrent fetches instead
+_MAX_PIPE_FILTER_LEN = 3500
+
+@app.route('/api/analyze-openalex', methods=['POST'])
+def analyze():
+    """Analyze a scholar through the OpenAlex API."""
+    data = _request_json()
+    if data is None:
+        return jsonify({'error': 'Request body must be a JSON object.'}), 400
+    query = data.get('query') or data.get('url', '')
+    max_papers = min(data.get('max_papers', 5), 10)
+    max_citations_per_paper = min(data.get('max_citations', 10), 25)
+
+    if not query:
+        return jsonify({'error': 'Provide an author name to search for.'}), 400
+
+    # Identical queries produce stable results within the cache window, so
+    # the ETag is just a digest of the request parameters: revalidations
+    # hit the 304 path without touching OpenAlex or the geocoder. The 304
+    # is conditioned on result_cache still holding the entry — the digest
+    # never changes for a given query, so answering past the server TTL
+    # would renew the client's stale copy forever.
+    cache_key = f"openalex:v1:{query}:{max_papers}:{max_citations_per_paper}"
+    etag = hashlib.blake2b(cache_key.encode(), digest_size=16).hexdigest()
+    cached_result = result_cache.get(cache_key, _CACHE_MISS)
+    if cached_result is not _CACHE_MISS:
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=304, headers={'ETag': etag})
+        return _cacheable_response(cached_result, etag)
+
+    try:
+        author = search_author_openalex(query)
+    except Exception as e:
+        logger.error("OpenAlex author search failed: %s", e)
+        author = None
+    if not author:
+        return jsonify({'error': 'Could not find this author on OpenAlex.'}), 404
+
+    last_known = author.get('last_known_institution') or {}
+    summary = author.get('summary_stats') or {}
+
+    result = {
+        'author': {
+            'name': author.get('display_name', 'Unknown'),
+            'affiliation': last_known.get('display_name', 'Unknown'),
+            'citations': author.get('cited_by_count', 0),
+            'h_index': summary.get('h_index', 0),
+        },
+        'publications': [],
+        'citing_authors': [],
+        'locations': []
+    }
+
+    author_openalex_id = author['id'].rsplit('/', 1)[-1]
+    try:
+        works = get_author_works(author_openalex_id, max_papers)
+    except Exception as e:
+        logger.error("OpenAlex works fetch failed: %s", e)
+        return jsonify({'error': 'Could not fetch works from OpenAlex.'}), 503
+
+    for work in works:
+        result['publications'].append({
+            'title': work.get('title') or 'Unknown',
+            'year': work.get('publication_year') or 'Unknown',
+            'citations': work.get('cited_by_count', 0)
+        })
+
+    # Works that nothing cites can't contribute citing authors — skip
+    # them before spending any requests
+    cited_works = [w for w in works if w.get('cited_by_count', 0) > 0]
+
+    # One batched request covers all works; fall back to concurrent
+    # per-work fetches if the filter is too long or the batch fails
+    work_ids = [w['id'].rsplit('/', 1)[-1] for w in cited_works if w.get('id')]
+    all_citing_works = None
+    if len('|'.join(work_ids)) <= _MAX_PIPE_FILTER_LEN:
+        try:
+            all_citing_works = list(
+                get_citing_works_batch(cited_works, max_citations_per_paper).values())
+        except Exception as e:
+            logger.warning("Batched citing-works fetch failed, falling back: %s", e)
+    if all_citing_works is None:
+        all_citing_works = asyncio.run(_gather_citing_works(cited_works, max_citations_per_paper))
+
+    all_citing_authors = []
+    inst_counts = Counter()
+    inst_authors = defaultdict(list)
+    for citing_works in all_citing_works:
+        for citing_work in citing_works:
+            authorships = citing_work.get('authorships') or []
+            if not authorships:
+                continue
+            citing_author_name = (authorships[0].get('author') or {}).get('display_name', '')
+            if not citing_author_name:
+                continue
+            institutions = authorships[0].get('institutions') or ()
+            citing_institution = canonical_institution(
+                institutions[0].get('display_name', '') if institutions else '')
+
+            all_citing_authors.append({
+                'name': citing_author_name,
+                'affiliation': citing_institution,
+                'paper_title': citing_work.get('title') or 'Unknown',
+                'year': citing_work.get('publication_year') or 'Unknown'
+            })
+
+            if not is_placeholder_affiliation(citing_institution):
+                inst_counts[citing_institution] += 1
+                note_location_author(inst_authors[citing_institution], citing_author_name)
+
+    result['citing_authors'] = all_citing_authors
+
+    geocoded = asyncio.run(_geocode_affiliations(list(inst_counts)))
+    locations = []
+    for affiliation, count in inst_counts.items():
+        coords = geocoded.get(affiliation)
+        if coords:
+            locations.append({
+                'institution': affiliation,
+                'lat': coords['lat'],
+                'lng': coords['lng'],
+                'count': count,
+                'authors': inst_authors[affiliation]
+            })
+    result['locations'] = locations
+
+    result_cache.set(cache_key, result, expire=_RESULT_TTL)
+    return _cacheable_response(result, etag)
+
+# Sentinel closing the event queue of a streaming analysis
+_STREAM_DONE = object()
+
+def _sse_event(event):
+    """Format one server-sent event."""
+    return f"data: {orjson.dumps(event).decode()}\n\n"
+
+def _request_json():
+    """Parse the request body with orjson; None for anything that is
+    not a JSON object, so callers can answer 400 the way Flask's own
+    request.json would instead of letting the decode error 500."""
+    try:
+        data = orjson.loads(request.get_data() or b'{}')
+    except orjson.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def _json_response(payload, status=200):
+    """Serialize a response payload with orjson (much faster than the
+    stdlib json behind Flask's jsonify for large result dicts)."""
+    return Response(orjson.dumps(payload), status=status, mimetype='application/json')
+
+def _cacheable_response(payload, etag):
+    """JSON response carrying ETag and Cache-Control validators, so
+    clients can revalidate with If-None-Match instead of re-running
+    the pipeline."""
+    response = _json_response(payload)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'public, max-age=%d' % _RESULT_TTL
+    return response
+
+@app.route('/api/analyze-stream', methods=['POST'])
+def analyze_scholar_stream():
+    """Stream analysis results as server-sent events.
+
+    The author card is emitted as soon as the profile is fetched, then one
+    event per processed publication (with its citing authors), then the
+    geocoded locations — so the frontend can render progressively instead
+    of staring at a spinner for the whole pipeline.
+    """
+    data = _request_json()
+    if data is None:
+        return jsonify({'error': 'Request body must be a JSON object.'}), 400
+    scholar_url = data.get('url', '')
+    max_papers = min(data.get('max_papers', 3), 5)
+    max_citations_per_paper = min(data.get('max_citations', 5), 10)
+
+    author_id = extract_author_id(scholar_url)
+    if not author_id:
+        return jsonify({
+            'error': 'Invalid Google Scholar URL. Please use a URL like: https://scholar.google.com/citations?user=XXXXX'
+        }), 400
+
+    events = queue.Queue()
+
+    def emit_author(author):
+        events.put({'type': 'author', 'payload': {
+            'name': author.get('name', 'Unknown'),
+            'affiliation': author.get('affiliation', 'Unknown'),
+            'citations': author.get('citedby', 0),
+            'h_index': author.get('hindex', 0),
+        }})
+
+    def emit_pub(pub_info, citing_infos):
+        events.put({'type': 'publication', 'payload': {
+            'publication': pub_info,
+            'citing_authors': citing_infos,
+        }})
+
+    def produce():
+        try:
+            if DIRECT_SCHOLAR:
+                author, pub_results = asyncio.run(analyze_direct(
+                    author_id, max_papers, max_citations_per_paper,
+                    on_author=emit_author, on_pub=emit_pub))
+                if not author:
+                    events.put({'type': 'error', 'payload': 'Could not fetch author information.'})
+                    return
+            else:
+                author = get_author_info(author_id)
+                if not author:
+                    events.put({'type': 'error', 'payload': 'Could not fetch author information.'})
+                    return
+                emit_author(author)
+
+                publications = heapq.nlargest(
+                    max_papers, author.get('publications', []),
+                    key=lambda x: x.get('num_citations', 0) or 0)
+                pub_results = asyncio.run(_process_publications(
+                    publications, max_citations_per_paper, on_pub=emit_pub))
+
+            affil_counts = Counter()
+            affil_authors = defaultdict(list)
+            for _, citing_infos in pub_results:
+                for citing_info in citing_infos:
+                    if not is_placeholder_affiliation(citing_info['affiliation']):
+                        affil_counts[citing_info['affiliation']] += 1
+                        note_location_author(affil_authors[citing_info['affiliation']],
+                                             citing_info['name'])
+
+            # Emit each location the moment its geocode resolves: cached
+            # institutions appear on the map immediately while the rate-
+            # limited lookups trickle in behind them
+            locations = []
+
+            def emit_location(affiliation, coords):
+                if not coords:
+                    return
+                location = {
+                    'institution': affiliation,
+                    'lat': coords['lat'],
+                    'lng': coords['lng'],
+                    'count': affil_counts[affiliation],
+                    'authors': affil_authors[affiliation]
+                }
+                locations.append(location)
+                events.put({'type': 'location', 'payload': location})
+
+            asyncio.run(_geocode_affiliations(list(affil_counts),
+                                              on_result=emit_location))
+            events.put({'type': 'locations', 'payload': locations})
+        except Exception as e:
+            logger.error("Streaming analysis failed: %s", e)
+            events.put({'type': 'error', 'payload': 'Analysis failed.'})
+        finally:
+            events.put(_STREAM_DONE)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    def generate():
+        while True:
+            event = events.get()
+            if event is _STREAM_DONE:
+                break
+            yield _sse_event(event)
 
-    return jsonify(result)
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
 # For local development
 if __name__ == '__main__':
@@ -1,70 +1,48 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
 from scholarly import scholarly
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+import orjson
 import re
-import time
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
 from functools import lru_cache
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Geocoding stack shared with api/index.py: one Nominatim client, one
+# persistent geocode cache accumulating hits across both app variants
+from api._common import (ORJSONProvider, DiskCache, _CACHE_MISS, _geocode_key,
+                         canonical_institution, geocode_institution,
+                         is_placeholder_affiliation, note_location_author,
+                         pub_cache, _PUB_TTL)
 
 app = Flask(__name__)
 CORS(app)
+# Large analyze responses (hundreds of citing authors and locations)
+# serialize 3-10x faster with orjson than with Flask's stdlib json
+app.json = ORJSONProvider(app)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (override with LOG_LEVEL=INFO for local debugging)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING'))
 logger = logging.getLogger(__name__)
 
-# Initialize geocoder with custom user agent
-geolocator = Nominatim(user_agent="citation-map-app")
-
-# Cache for geocoding results
-geocode_cache = {}
+# Compiled once at import; extract_author_id runs on every analyze request.
+# A single pattern suffices: the old citations\?.*user= variant matched a
+# strict subset of what this matches.
+_USER_RE = re.compile(r'[?&]user=([a-zA-Z0-9_-]+)')
 
 def extract_author_id(url):
     """Extract Google Scholar author ID from URL."""
-    patterns = [
-        r'user=([a-zA-Z0-9_-]+)',
-        r'citations\?.*user=([a-zA-Z0-9_-]+)',
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
-
-@lru_cache(maxsize=1000)
-def geocode_institution(institution):
-    """Geocode an institution name to coordinates."""
-    if not institution or institution.strip() == '':
-        return None
-
-    # Clean the institution name
-    institution = institution.strip()
+    match = _USER_RE.search(url)
+    return match.group(1) if match else None
 
-    # Check cache first
-    if institution in geocode_cache:
-        return geocode_cache[institution]
-
-    try:
-        time.sleep(1)  # Rate limiting for Nominatim
-        location = geolocator.geocode(institution, timeout=10)
-        if location:
-            result = {
-                'lat': location.latitude,
-                'lng': location.longitude,
-                'address': location.address
-            }
-            geocode_cache[institution] = result
-            return result
-    except (GeocoderTimedOut, GeocoderServiceError) as e:
-        logger.warning(f"Geocoding failed for {institution}: {e}")
-    except Exception as e:
-        logger.error(f"Unexpected error geocoding {institution}: {e}")
-
-    geocode_cache[institution] = None
-    return None
+# Analyses are deterministic in (author_id, max_papers, max_citations)
+# over short windows; caching the finished response turns repeat URLs
+# into a single sqlite read instead of a full Scholar + Nominatim pass.
+# Prefixed keys keep this variant's entries separate from api/index.py's
+# in the shared cache file.
+result_cache = DiskCache('/tmp/citation_map_results.db')
+_RESULT_TTL = 3600
 
 def get_author_info(author_id):
     """Get author information from Google Scholar."""
@@ -73,16 +51,59 @@ def get_author_info(author_id):
         author = scholarly.fill(author, sections=['basics', 'publications'])
         return author
     except Exception as e:
-        logger.error(f"Error fetching author info: {e}")
+        logger.error("Error fetching author info: %s", e)
         return None
 
+# Shared pool for the per-author profile searches: get_citing_authors now
+# runs for several publications at once, and a pool per call would
+# multiply into dozens of concurrent Scholar searches. One module-level
+# pool caps the global fan-out regardless of how many publications are
+# in flight.
+_AFFILIATION_POOL = ThreadPoolExecutor(max_workers=10)
+
+@lru_cache(maxsize=2048)
+def _lookup_affiliation(author_name):
+    """Look up a citing author's affiliation via Scholar profile search.
+
+    Memoized across requests: prolific citing authors recur between
+    analyses, and each search is a full Scholar round trip. Concurrent
+    first lookups of the same name can race past the cache, which only
+    costs a duplicate search, never a wrong answer.
+    """
+    try:
+        author_result = next(scholarly.search_author(author_name), None)
+        if author_result:
+            return author_result.get('affiliation', '')
+    except Exception as e:
+        logger.warning("Error getting affiliation for %s: %s", author_name, e)
+    return ''
+
+def _filled_publication(pub):
+    """scholarly.fill cached on disk by author_pub_id.
+
+    Filling is one of the heaviest Scholar operations and publication
+    IDs are stable, so warm analyses skip the fetch-and-parse entirely.
+    """
+    pub_id = pub.get('author_pub_id')
+    if pub_id:
+        cached = pub_cache.get(pub_id, _CACHE_MISS)
+        if cached is not _CACHE_MISS:
+            return cached
+    filled = scholarly.fill(pub)
+    if pub_id:
+        try:
+            pub_cache.set(pub_id, filled, expire=_PUB_TTL)
+        except (TypeError, ValueError):
+            pass  # non-JSON payloads simply skip the cache
+    return filled
+
 def get_citing_authors(publication, max_citations=20):
     """Get authors who cited a specific publication."""
     citing_authors = []
 
     try:
         # Fill publication to get citations
-        pub_filled = scholarly.fill(publication)
+        pub_filled = _filled_publication(publication)
 
         # Get citations for this publication
         citations = scholarly.citedby(pub_filled)
@@ -93,37 +114,43 @@ def get_citing_authors(publication, max_citations=20):
                 break
 
             try:
-                # Get author information from citing paper
-                if 'author' in citation:
-                    authors = citation.get('author', '').split(' and ')
-                    for author_name in authors[:3]:  # Limit to first 3 authors
-                        author_name = author_name.strip()
-                        if author_name:
-                            citing_author = {
-                                'name': author_name,
-                                'paper_title': citation.get('bib', {}).get('title', 'Unknown'),
-                                'year': citation.get('bib', {}).get('pub_year', 'Unknown'),
-                                'affiliation': ''
-                            }
-
-                            # Try to find author profile for affiliation
-                            try:
-                                search_query = scholarly.search_author(author_name)
-                                author_result = next(search_query, None)
-                                if author_result:
-                                    citing_author['affiliation'] = author_result.get('affiliation', '')
-                            except:
-                                pass
-
-                            citing_authors.append(citing_author)
+                # Author names live under bib on citedby results, not at
+                # the top level; affiliations are backfilled in parallel
+                # below since Scholar snippets never carry them
+                bib = citation.get('bib', {})
+                # scholarly already splits the byline into a list of
+                # names for citedby results; no parsing needed here
+                authors = bib.get('author') or []
+                for author_name in authors[:3]:  # Limit to first 3 authors
+                    author_name = author_name.strip()
+                    if author_name:
+                        citing_authors.append({
+                            'name': author_name,
+                            'paper_title': bib.get('title', 'Unknown'),
+                            'year': bib.get('pub_year', 'Unknown'),
+                            'affiliation': ''
+                        })
 
                 count += 1
             except Exception as e:
-                logger.warning(f"Error processing citation: {e}")
+                logger.warning("Error processing citation: %s", e)
                 continue
 
     except Exception as e:
-        logger.warning(f"Error getting citations: {e}")
+        logger.warning("Error getting citations: %s", e)
+
+    # The profile searches dominate wall time and are independent per
+    # name, so run them in parallel on the shared pool — deduplicated,
+    # with the pool size bounding total Scholar pressure
+    unique_names = {c['name'] for c in citing_authors if not c['affiliation']}
+    if unique_names:
+        futures = {_AFFILIATION_POOL.submit(_lookup_affiliation, name): name
+                   for name in unique_names}
+        affiliations = {futures[future]: future.result()
+                        for future in as_completed(futures)}
+        for citing_author in citing_authors:
+            if not citing_author['affiliation']:
+                citing_author['affiliation'] = affiliations.get(citing_author['name'], '')
 
     return citing_authors
 
@@ -145,6 +172,11 @@ def analyze_scholar():
     if not author_id:
         return jsonify({'error': 'Invalid Google Scholar URL'}), 400
 
+    cache_key = f"app:v1:{author_id}:{max_papers}:{max_citations_per_paper}"
+    cached_result = result_cache.get(cache_key)
+    if cached_result is not None:
+        return jsonify(cached_result)
+
     # Get author information
     author = get_author_info(author_id)
     if not author:
@@ -166,53 +198,169 @@ def analyze_scholar():
     publications = author.get('publications', [])[:max_papers]
 
     all_citing_authors = []
-    affiliations = {}
-
-    for pub in publications:
-        pub_info = {
-            'title': pub.get('bib', {}).get('title', 'Unknown'),
-            'year': pub.get('bib', {}).get('pub_year', 'Unknown'),
-            'citations': pub.get('num_citations', 0)
-        }
-        result['publications'].append(pub_info)
-
-        # Get citing authors for this publication
-        if pub.get('num_citations', 0) > 0:
-            citing = get_citing_authors(pub, max_citations_per_paper)
-            for author_info in citing:
-                all_citing_authors.append(author_info)
-
-                # Track affiliations
-                affiliation = author_info.get('affiliation', '')
-                if affiliation:
-                    if affiliation not in affiliations:
-                        affiliations[affiliation] = {
-                            'name': affiliation,
-                            'count': 0,
-                            'authors': []
-                        }
-                    affiliations[affiliation]['count'] += 1
-                    affiliations[affiliation]['authors'].append(author_info['name'])
-
-    result['citing_authors'] = all_citing_authors
-
-    # Geocode affiliations
-    locations = []
-    for affiliation, info in affiliations.items():
-        coords = geocode_institution(affiliation)
-        if coords:
-            locations.append({
-                'institution': affiliation,
-                'lat': coords['lat'],
-                'lng': coords['lng'],
-                'count': info['count'],
-                'authors': list(set(info['authors']))[:5]  # Unique authors, max 5
-            })
+    # SoA accumulators, matching api/index.py: the hot per-citing-author
+    # update is a bare Counter increment plus a capped append, instead of
+    # building and probing a nested dict entry. Keyed by the normalized
+    # geocode key so spelling variants of one institution share a single
+    # entry (and a single geocode) instead of duplicate map pins.
+    affil_names = {}
+    affil_counts = Counter()
+    affil_authors = defaultdict(list)
+
+    # Geocoding is rate-limited to 1 req/s, so start each unique
+    # affiliation in the background as soon as it is discovered — the
+    # Nominatim delay then overlaps with the remaining Scholar fetches
+    # instead of being paid serially at the end
+    with ThreadPoolExecutor(max_workers=1) as geocode_pool:
+        geocode_futures = {}
+
+        # Publication metadata is already on the author object; record it
+        # up front so result ordering is independent of fetch completion
+        for pub in publications:
+            pub_info = {
+                'title': pub.get('bib', {}).get('title', 'Unknown'),
+                'year': pub.get('bib', {}).get('pub_year', 'Unknown'),
+                'citations': pub.get('num_citations', 0)
+            }
+            result['publications'].append(pub_info)
+
+        # Each get_citing_authors call is a chain of Scholar round trips;
+        # fanning publications out in parallel drops the stage from the
+        # sum of per-publication latencies to roughly the slowest one
+        cited_pubs = [pub for pub in publications if pub.get('num_citations', 0) > 0]
+        if cited_pubs:
+            with ThreadPoolExecutor(max_workers=min(8, len(cited_pubs))) as pub_pool:
+                pub_futures = [pub_pool.submit(get_citing_authors, pub,
+                                               max_citations_per_paper)
+                               for pub in cited_pubs]
+                for future in as_completed(pub_futures):
+                    for author_info in future.result():
+                        all_citing_authors.append(author_info)
+
+                        # Track affiliations
+                        affiliation = author_info.get('affiliation', '')
+                        if not is_placeholder_affiliation(affiliation):
+                            display = canonical_institution(affiliation)
+                            key = _geocode_key(display)
+                            if key not in affil_names:
+                                affil_names[key] = display
+                                geocode_futures[geocode_pool.submit(
+                                    geocode_institution, display)] = key
+                            affil_counts[key] += 1
+                            note_location_author(affil_authors[key], author_info['name'])
+
+        result['citing_authors'] = all_citing_authors
+
+        # Collect geocode results (most finished while Scholar calls ran)
+        locations = []
+        for future in as_completed(geocode_futures):
+            coords = future.result()
+            if coords:
+                key = geocode_futures[future]
+                locations.append({
+                    'institution': affil_names[key],
+                    'lat': coords['lat'],
+                    'lng': coords['lng'],
+                    'count': affil_counts[key],
+                    'authors': affil_authors[key]  # Unique authors, max 5, first seen
+                })
 
     result['locations'] = locations
 
+    result_cache.set(cache_key, result, expire=_RESULT_TTL)
+
     return jsonify(result)
 
+@app.route('/api/analyze-stream', methods=['POST'])
+def analyze_scholar_stream():
+    """Streaming variant of /api/analyze emitting newline-delimited JSON.
+
+    Each event is one JSON object per line — the author first, then
+    publications, citing-author batches as publications complete, and
+    locations as geocodes resolve — so the UI renders progressively
+    instead of waiting out the whole pipeline.
+    """
+    data = request.json
+    scholar_url = data.get('url', '')
+    max_papers = data.get('max_papers', 5)
+    max_citations_per_paper = data.get('max_citations', 10)
+
+    author_id = extract_author_id(scholar_url)
+    if not author_id:
+        return jsonify({'error': 'Invalid Google Scholar URL'}), 400
+
+    def _event(event_type, payload):
+        # orjson emits bytes; yielding them directly skips both the
+        # stdlib encoder and the str round trip on every event
+        return orjson.dumps({'type': event_type, 'payload': payload}) + b'\n'
+
+    def generate():
+        author = get_author_info(author_id)
+        if not author:
+            yield _event('error', 'Could not fetch author information')
+            return
+
+        yield _event('author', {
+            'name': author.get('name', 'Unknown'),
+            'affiliation': author.get('affiliation', 'Unknown'),
+            'citations': author.get('citedby', 0),
+            'h_index': author.get('hindex', 0),
+        })
+
+        publications = author.get('publications', [])[:max_papers]
+        for pub in publications:
+            yield _event('publication', {
+                'title': pub.get('bib', {}).get('title', 'Unknown'),
+                'year': pub.get('bib', {}).get('pub_year', 'Unknown'),
+                'citations': pub.get('num_citations', 0)
+            })
+
+        affil_names = {}
+        affil_counts = Counter()
+        affil_authors = defaultdict(list)
+
+        with ThreadPoolExecutor(max_workers=1) as geocode_pool:
+            geocode_futures = {}
+
+            cited_pubs = [pub for pub in publications if pub.get('num_citations', 0) > 0]
+            if cited_pubs:
+                with ThreadPoolExecutor(max_workers=min(8, len(cited_pubs))) as pub_pool:
+                    pub_futures = [pub_pool.submit(get_citing_authors, pub,
+                                                   max_citations_per_paper)
+                                   for pub in cited_pubs]
+                    for future in as_completed(pub_futures):
+                        citing = future.result()
+                        for author_info in citing:
+                            affiliation = author_info.get('affiliation', '')
+                            if not is_placeholder_affiliation(affiliation):
+                                display = canonical_institution(affiliation)
+                                key = _geocode_key(display)
+                                if key not in affil_names:
+                                    affil_names[key] = display
+                                    geocode_futures[geocode_pool.submit(
+                                        geocode_institution, display)] = key
+                                affil_counts[key] += 1
+                                note_location_author(affil_authors[key], author_info['name'])
+                        if citing:
+                            yield _event('citing_authors', citing)
+
+            for future in as_completed(geocode_futures):
+                coords = future.result()
+                if coords:
+                    key = geocode_futures[future]
+                    yield _event('location', {
+                        'institution': affil_names[key],
+                        'lat': coords['lat'],
+                        'lng': coords['lng'],
+                        'count': affil_counts[key],
+                        'authors': affil_authors[key]
+                    })
+
+        yield _event('done', None)
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/x-ndjson')
+
 @app.route('/api/quick-analyze', methods=['POST'])
 def quick_analyze():
     """Quick analysis with sample data for testing."""